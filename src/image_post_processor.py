@@ -4,7 +4,7 @@ import numpy as np
 from scipy.ndimage import binary_dilation
 
 from .distance_image_annotator import DistanceImageAnnotator
-from .utils import draw_text_with_box
+from .number_overlay import NumberOverlay
 
 
 # annotationした画像の後処理
@@ -17,6 +17,7 @@ class ImagePostProcessor:
         self._image = image
         self._anns = anns
         self._distance_image_annotator = DistanceImageAnnotator(anns)
+        self._number_overlay = NumberOverlay()
         # seedを固定
         np.random.seed(0)
 
@@ -69,6 +70,7 @@ class ImagePostProcessor:
         color_of_number: tuple = (255, 0, 0),
         background_color_of_number: tuple = (0, 0, 0),
         height_of_number: Union[int, str] = "auto",
+        avoid_number_collision: bool = False,
     ) -> np.ndarray:
         """get_anns_img
 
@@ -83,6 +85,7 @@ class ImagePostProcessor:
             boundary_thickness (int, optional): 境界線の太さ. Defaults to 3.
             add_numbers (bool, optional): annotationに番号を追加するかどうか. Defaults to True.
             height_of_number (Union[int, str], optional): 番号の高さ. Defaults to "auto".
+            avoid_number_collision (bool, optional): 番号の矩形同士が重ならないように番号をずらすかどうか. Defaults to False.
 
         Returns:
             np.array: annotationを追加した画像
@@ -123,6 +126,7 @@ class ImagePostProcessor:
                 color=color_of_number,
                 background_color=background_color_of_number,
                 height=height_of_number,
+                avoid_collision=avoid_number_collision,
             )
         return mask_image
 
@@ -216,33 +220,18 @@ class ImagePostProcessor:
         color: tuple = (255, 0, 0),
         background_color: tuple = (0, 0, 0),
         height: Union[int, str] = "auto",
+        avoid_collision: bool = False,
     ) -> np.ndarray:
         coords = self._distance_image_annotator.get_max_distance_coordinates()
-        for i, coord in enumerate(coords):
-            if type(height) == str and height == "auto":
-                image = draw_text_with_box(
-                    image,
-                    str(i),
-                    coord,
-                    color=color,
-                    background_color=background_color,
-                    auto_height=True,
-                )
-            elif type(height) == int:
-                image = draw_text_with_box(
-                    image,
-                    str(i),
-                    coord,
-                    color=color,
-                    background_color=background_color,
-                    height=height,
-                )
-            else:
-                image = draw_text_with_box(
-                    image,
-                    str(i),
-                    coord,
-                    color=color,
-                    background_color=background_color,
-                )
-        return image
+        if type(height) == str and height == "auto":
+            height = image.shape[0] // 50
+        elif type(height) != int:
+            height = 20
+        return self._number_overlay.draw(
+            image,
+            coords,
+            color=color,
+            background_color=background_color,
+            height=height,
+            avoid_collision=avoid_collision,
+        )
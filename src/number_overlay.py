@@ -0,0 +1,483 @@
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class NumberOverlay:
+    """NumberOverlay
+    画像上の複数の座標に番号を一括で描画するクラス
+
+    utils.draw_text_with_boxを番号ごとに呼ぶ代わりに，
+    フォントスケール，文字の画素，背景色の画像をキャッシュし，全ての矩形の位置を先に求めてから合成する．
+    重なる番号は層に分け，層ごとに文字をまとめて書き込む．
+    デフォルトの配置ではdraw_text_with_boxを順に呼んだ場合と同じ画像が得られる．
+    キャッシュはインスタンスごとに持つ．
+    """
+
+    def __init__(
+        self,
+        padding: int = 5,
+        font: int = cv2.FONT_HERSHEY_SIMPLEX,
+        thickness: int = 2,
+    ):
+        self._padding = padding
+        self._font = font
+        self._thickness = thickness
+        # height -> フォントスケール
+        self._scale_cache: Dict[int, float] = {}
+        # (text, height) -> 文字の画素
+        self._glyph_cache: Dict[Tuple[str, int], tuple] = {}
+        # (background_color, チャンネル数) -> 背景色の画像
+        self._back_rect_cache: Dict[Tuple[tuple, int], np.ndarray] = {}
+
+    def _get_scale(self, height: int) -> float:
+        if height not in self._scale_cache:
+            self._scale_cache[height] = cv2.getFontScaleFromHeight(
+                self._font, height, self._thickness
+            )
+        return self._scale_cache[height]
+
+    def _get_glyph(self, text: str, height: int) -> tuple:
+        """_get_glyph
+
+        文字列を描画した画素を取得する．一度描画したものはキャッシュする．
+        Hersheyフォントは1文字ごとの送り幅が整数ピクセルにならないため，
+        数字単位ではなく文字列単位で描画する．
+
+        Args:
+            text (str): 描画する文字列
+            height (int): 文字の高さ
+
+        Returns:
+            tuple: (offsets, bounds, size, baseline)
+                offsets: 文字の画素のorgからの相対座標 (ys, xs)．アンチエイリアスが掛かる場合はNone
+                bounds: 文字が収まる範囲のorgからの相対座標 (top, left, bottom, right)
+                size: 文字サイズ (w, h)
+                baseline: ベースライン
+        """
+        key = (text, height)
+        if key in self._glyph_cache:
+            return self._glyph_cache[key]
+        scale = self._get_scale(height)
+        size, baseline = cv2.getTextSize(text, self._font, scale, self._thickness)
+        # 文字の太さ分の余白を取って描画し，はみ出す場合は余白を広げて描画し直す
+        margin = self._thickness * 2 + 2
+        while True:
+            canvas = np.zeros(
+                (size[1] + baseline + margin * 2, size[0] + margin * 2),
+                dtype=np.uint8,
+            )
+            org = (margin, margin + size[1])  # x, y
+            cv2.putText(canvas, text, org, self._font, scale, 255, self._thickness)
+            if not (canvas[[0, -1], :].any() or canvas[:, [0, -1]].any()):
+                break
+            margin *= 2
+        bounds = (
+            -org[1],
+            -org[0],
+            canvas.shape[0] - org[1],
+            canvas.shape[1] - org[0],
+        )
+        if np.any((canvas != 0) & (canvas != 255)):
+            # アンチエイリアスが掛かる場合は背景に依存するので，画素を書き込む方法は使わない
+            offsets = None
+        else:
+            ys, xs = np.nonzero(canvas)
+            offsets = (ys + bounds[0], xs + bounds[1])
+        glyph = (offsets, bounds, size, baseline)
+        self._glyph_cache[key] = glyph
+        return glyph
+
+    def _get_back_rect(
+        self, background_color: tuple, channels: int, height: int, width: int
+    ) -> np.ndarray:
+        """_get_back_rect
+
+        半透明の矩形の合成に使う背景色の画像を取得する．
+        番号ごとに確保しないように，必要な大きさ以上のものをキャッシュして切り出して使う．
+
+        Args:
+            background_color (tuple): 矩形の色
+            channels (int): 画像のチャンネル数
+            height (int): 必要な高さ
+            width (int): 必要な幅
+
+        Returns:
+            np.ndarray: (height以上, width以上, channels) の背景色の画像
+        """
+        key = (tuple(background_color), channels)
+        back_rect = self._back_rect_cache.get(key)
+        if (
+            back_rect is None
+            or back_rect.shape[0] < height
+            or back_rect.shape[1] < width
+        ):
+            back_rect = np.zeros((height, width, channels), dtype=np.uint8)
+            back_rect[:] = (
+                (*background_color, 255) if channels == 4 else background_color
+            )
+            self._back_rect_cache[key] = back_rect
+        return back_rect
+
+    @staticmethod
+    def _overlapping_pairs(rects: np.ndarray) -> np.ndarray:
+        """_overlapping_pairs
+
+        重なっている矩形の組をまとめて求める．
+        最大の矩形以上の大きさの格子に矩形の左上を割り当てると，
+        重なる矩形は同じか隣の格子にしか入らないので，その組だけを調べる．
+
+        Args:
+            rects (np.ndarray): 矩形 (N, 4) [top, left, bottom, right]
+
+        Returns:
+            np.ndarray: 重なっている矩形のindexの組 (P, 2)．各組は (小さいindex, 大きいindex)
+        """
+        n = len(rects)
+        if n < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+        cell_h = max(int((rects[:, 2] - rects[:, 0]).max()), 1)
+        cell_w = max(int((rects[:, 3] - rects[:, 1]).max()), 1)
+        cell_y = (rects[:, 0] - rects[:, 0].min()) // cell_h
+        cell_x = (rects[:, 1] - rects[:, 1].min()) // cell_w
+        # 右端に空の列を置いて，左右の隣が次の行に回り込まないようにする
+        n_cols = int(cell_x.max()) + 2
+        keys = cell_y * n_cols + cell_x
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        firsts = []
+        seconds = []
+        # 同じ格子と，右・左下・下・右下の格子にある矩形との組
+        for dy, dx in [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]:
+            targets = keys + dy * n_cols + dx
+            lo = np.searchsorted(sorted_keys, targets, side="left")
+            counts = np.searchsorted(sorted_keys, targets, side="right") - lo
+            first = np.repeat(np.arange(n), counts)
+            local = np.arange(counts.sum()) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            second = order[np.repeat(lo, counts) + local]
+            if dy == 0 and dx == 0:
+                # 同じ格子の組は両方向に現れるので片方だけ残す
+                keep = first < second
+                first, second = first[keep], second[keep]
+            firsts.append(first)
+            seconds.append(second)
+        first = np.concatenate(firsts)
+        second = np.concatenate(seconds)
+        a, b = rects[first], rects[second]
+        overlaps = (
+            (a[:, 0] < b[:, 2])
+            & (b[:, 0] < a[:, 2])
+            & (a[:, 1] < b[:, 3])
+            & (b[:, 1] < a[:, 3])
+        )
+        return np.sort(np.stack([first[overlaps], second[overlaps]], axis=1), axis=1)
+
+    def _get_boxes(
+        self,
+        orgs: np.ndarray,
+        sizes: np.ndarray,
+        baselines: np.ndarray,
+        height: int,
+        image_shape: tuple,
+    ) -> np.ndarray:
+        # draw_text_with_boxと同じ規則で矩形を求める
+        # orgs: (N, 2) (y, x), sizes: (N, 2) (w, h), baselines: (N,)
+        # return: (N, 4) [top, left, bottom, right]
+        rect_x = np.maximum(orgs[:, 1] - self._padding, 0)
+        rect_y = np.maximum(orgs[:, 0] - height - self._padding, 0)
+        rect_w = np.minimum(sizes[:, 0] + self._padding * 2, image_shape[1] - rect_x)
+        rect_h = np.minimum(
+            sizes[:, 1] + baselines + self._padding * 2, image_shape[0] - rect_y
+        )
+        return np.stack(
+            [
+                rect_y,
+                rect_x,
+                rect_y + np.maximum(rect_h, 0),
+                rect_x + np.maximum(rect_w, 0),
+            ],
+            axis=1,
+        )
+
+    def _get_candidates(
+        self,
+        orgs: np.ndarray,
+        sizes: np.ndarray,
+        baselines: np.ndarray,
+        height: int,
+        image_shape: tuple,
+        max_steps: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """_get_candidates
+
+        全ての番号について，ずらす先の候補の座標と矩形をまとめて求める．
+        下，上，右，左の順に矩形の大きさ単位でずらし，それをmax_steps回まで繰り返す．
+        画像の端では矩形が切り詰められるので，候補ごとに実際に描画される矩形を求める．
+
+        Args:
+            orgs (np.ndarray): 番号の座標 (N, 2) (y, x)
+            sizes (np.ndarray): 文字サイズ (N, 2) (w, h)
+            baselines (np.ndarray): ベースライン (N,)
+            height (int): 文字の高さ
+            image_shape (tuple): 画像のshape
+            max_steps (int): ずらす回数の上限
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]:
+                候補の座標 (N, K, 2), 候補の矩形 (N, K, 4), 候補が使えるかどうか (N, K)
+        """
+        # 切り詰める前の矩形の大きさ
+        box_h = sizes[:, 1] + baselines + self._padding * 2
+        box_w = sizes[:, 0] + self._padding * 2
+        zeros = np.zeros_like(box_h)
+        directions = np.stack(
+            [
+                np.stack([box_h, zeros], axis=1),
+                np.stack([-box_h, zeros], axis=1),
+                np.stack([zeros, box_w], axis=1),
+                np.stack([zeros, -box_w], axis=1),
+            ],
+            axis=1,
+        )
+        steps = np.arange(1, max_steps + 1)[None, :, None, None]
+        n, n_candidates = len(orgs), max_steps * 4
+        candidates = (orgs[:, None, None, :] + directions[:, None] * steps).reshape(
+            n, n_candidates, 2
+        )
+        candidate_boxes = self._get_boxes(
+            candidates.reshape(-1, 2),
+            np.repeat(sizes, n_candidates, axis=0),
+            np.repeat(baselines, n_candidates),
+            height,
+            image_shape,
+        ).reshape(n, n_candidates, 4)
+        valid = (
+            (candidates[..., 0] >= 0)
+            & (candidates[..., 0] < image_shape[0])
+            & (candidates[..., 1] >= 0)
+            & (candidates[..., 1] < image_shape[1])
+            & (candidate_boxes[..., 2] > candidate_boxes[..., 0])
+            & (candidate_boxes[..., 3] > candidate_boxes[..., 1])
+        )
+        return candidates, candidate_boxes, valid
+
+    def _layout(
+        self,
+        texts: List[str],
+        coords: List[tuple],
+        image_shape: tuple,
+        height: int,
+        avoid_collision: bool,
+        max_steps: int,
+    ) -> Tuple[list, np.ndarray, np.ndarray]:
+        # return: 文字のリスト, 番号の座標 (N, 2) (y, x), 矩形 (N, 4)
+        glyphs = [self._get_glyph(text, height) for text in texts]
+        orgs = np.array(coords, dtype=np.int64).reshape(-1, 2)
+        sizes = np.array([glyph[2] for glyph in glyphs], dtype=np.int64).reshape(-1, 2)
+        baselines = np.array([glyph[3] for glyph in glyphs], dtype=np.int64)
+        boxes = self._get_boxes(orgs, sizes, baselines, height, image_shape)
+        if not avoid_collision or len(orgs) == 0:
+            return glyphs, orgs, boxes
+        candidates, candidate_boxes, valid = self._get_candidates(
+            orgs, sizes, baselines, height, image_shape, max_steps
+        )
+        # 配置済みの矩形を画素単位の占有マップに書き込み，候補の範囲だけを調べる
+        # 前から順に，重なる番号は最初に空いている候補の位置にずらす
+        occupied = np.zeros(image_shape[:2], dtype=bool)
+        boxes_list = boxes.tolist()
+        candidate_boxes_list = candidate_boxes.tolist()
+        valid_list = valid.tolist()
+        for i in range(len(orgs)):
+            top, left, bottom, right = boxes_list[i]
+            if occupied[top:bottom, left:right].any():
+                for k, (top_, left_, bottom_, right_) in enumerate(
+                    candidate_boxes_list[i]
+                ):
+                    if (
+                        valid_list[i][k]
+                        and not occupied[top_:bottom_, left_:right_].any()
+                    ):
+                        orgs[i] = candidates[i, k]
+                        boxes[i] = candidate_boxes[i, k]
+                        top, left, bottom, right = top_, left_, bottom_, right_
+                        break
+            occupied[top:bottom, left:right] = True
+        return glyphs, orgs, boxes
+
+    def layout(
+        self,
+        coords: List[tuple],
+        image_shape: tuple,
+        height: int = 20,
+        avoid_collision: bool = False,
+        max_steps: int = 3,
+        texts: Optional[List[str]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """layout
+
+        全ての番号の座標と矩形をまとめて求める
+
+        Args:
+            coords (List[tuple]): 番号の座標 (y, x) のリスト
+            image_shape (tuple): 描画先の画像のshape
+            height (int, optional): 番号の高さ. Defaults to 20.
+            avoid_collision (bool, optional): 矩形同士が重ならないように番号をずらすかどうか. Defaults to False.
+            max_steps (int, optional): 番号をずらす回数の上限. Defaults to 3.
+            texts (Optional[List[str]], optional): 描画する文字列. Defaults to None. Noneの場合は0からの連番を使用
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 番号の座標 (N, 2) (y, x) と矩形 (N, 4) [top, left, bottom, right]
+        """
+        if texts is None:
+            texts = [str(i) for i in range(len(coords))]
+        _, orgs, boxes = self._layout(
+            texts, coords, image_shape, height, avoid_collision, max_steps
+        )
+        return orgs, boxes
+
+    def _get_layers(self, footprints: np.ndarray) -> List[List[int]]:
+        """_get_layers
+
+        番号を描画する層に分ける．
+        重なる番号の組では後の番号を1つ上の層に置き，層が変わらなくなるまで繰り返す．
+
+        Args:
+            footprints (np.ndarray): 番号ごとの矩形と文字を合わせた範囲 (N, 4)
+
+        Returns:
+            List[List[int]]: 層ごとの番号のindex
+        """
+        pairs = self._overlapping_pairs(footprints)
+        layers = np.zeros(len(footprints), dtype=np.int64)
+        while len(pairs) > 0:
+            new_layers = layers.copy()
+            np.maximum.at(new_layers, pairs[:, 1], layers[pairs[:, 0]] + 1)
+            if np.array_equal(new_layers, layers):
+                break
+            layers = new_layers
+        order = np.argsort(layers, kind="stable")
+        splits = np.flatnonzero(np.diff(layers[order])) + 1
+        return [indices.tolist() for indices in np.split(order, splits)]
+
+    def _blend_box(
+        self, image: np.ndarray, box: List[int], back_rect: np.ndarray
+    ) -> None:
+        # draw_translucent_rectと同じ合成を行う
+        top, left, bottom, right = box
+        if bottom > top and right > left:
+            image[top:bottom, left:right] = cv2.addWeighted(
+                image[top:bottom, left:right],
+                0.3,
+                back_rect[: bottom - top, : right - left],
+                0.7,
+                1.0,
+            )
+
+    def _can_stamp(self, glyph: tuple, org: List[int], image_shape: tuple) -> bool:
+        # 画像の端ではputTextの切り取り方が異なるので，キャッシュした画素は使えない
+        bounds = glyph[1]
+        return (
+            glyph[0] is not None
+            and org[0] + bounds[0] >= 1
+            and org[1] + bounds[1] >= 1
+            and org[0] + bounds[2] <= image_shape[0] - 1
+            and org[1] + bounds[3] <= image_shape[1] - 1
+        )
+
+    def _put_text(
+        self, image: np.ndarray, text: str, org: List[int], height: int, color: tuple
+    ) -> None:
+        cv2.putText(
+            image,
+            text,
+            (org[1], org[0]),
+            self._font,
+            self._get_scale(height),
+            color,
+            self._thickness,
+        )
+
+    def draw(
+        self,
+        image: np.ndarray,
+        coords: List[tuple],
+        color: tuple = (255, 0, 0),
+        background_color: tuple = (0, 0, 0),
+        height: int = 20,
+        avoid_collision: bool = False,
+        max_steps: int = 3,
+        texts: Optional[List[str]] = None,
+    ) -> np.ndarray:
+        """draw
+
+        画像に番号を半透明の矩形付きで描画する
+
+        Args:
+            image (np.ndarray): 描画先の画像 (H, W, 3) or (H, W, 4). uint8
+            coords (List[tuple]): 番号の座標 (y, x) のリスト
+            color (tuple, optional): 番号の色. Defaults to (255, 0, 0).
+            background_color (tuple, optional): 矩形の色. Defaults to (0, 0, 0).
+            height (int, optional): 番号の高さ. Defaults to 20.
+            avoid_collision (bool, optional): 矩形同士が重ならないように番号をずらすかどうか. Defaults to False.
+            max_steps (int, optional): 番号をずらす回数の上限. Defaults to 3.
+            texts (Optional[List[str]], optional): 描画する文字列. Defaults to None. Noneの場合は0からの連番を使用
+
+        Returns:
+            np.ndarray: 番号を描画した画像
+        """
+        if len(coords) == 0:
+            return image
+        if texts is None:
+            texts = [str(i) for i in range(len(coords))]
+        # 文字をまとめて書き込むためにメモリ上で連続した画像にする
+        image = np.ascontiguousarray(image)
+        _, image_w, channels = image.shape
+
+        # 全ての番号の矩形と文字の位置を先に求める
+        glyphs, orgs, boxes = self._layout(
+            texts, coords, image.shape, height, avoid_collision, max_steps
+        )
+        # 矩形と文字を合わせた範囲が重なる番号は，後の番号が上に来るように層に分ける
+        # 同じ層の番号同士は重ならないので，層ごとに文字をまとめて書き込める
+        bounds = np.array([glyph[1] for glyph in glyphs], dtype=np.int64)
+        text_rects = bounds + orgs[:, [0, 1, 0, 1]]
+        footprints = np.concatenate(
+            [
+                np.minimum(boxes[:, :2], text_rects[:, :2]),
+                np.maximum(boxes[:, 2:], text_rects[:, 2:]),
+            ],
+            axis=1,
+        )
+        layers = self._get_layers(footprints)
+
+        back_rect = self._get_back_rect(
+            background_color,
+            channels,
+            int((boxes[:, 2] - boxes[:, 0]).max()),
+            int((boxes[:, 3] - boxes[:, 1]).max()),
+        )
+        text_color = np.zeros(channels, dtype=np.uint8)
+        text_color[: min(len(color), channels)] = color[:channels]
+        flat = image.reshape(-1)
+        orgs_list = orgs.tolist()
+        boxes_list = boxes.tolist()
+        for layer in layers:
+            # 矩形はcv2.addWeightedで1つずつ合成する
+            # 全ての矩形の画素を集めて合成するよりも，この方が速い
+            text_pixels = []
+            for i in layer:
+                self._blend_box(image, boxes_list[i], back_rect)
+                org = orgs_list[i]
+                if self._can_stamp(glyphs[i], org, image.shape):
+                    ys, xs = glyphs[i][0]
+                    text_pixels.append((ys + org[0]) * image_w + xs + org[1])
+                else:
+                    self._put_text(image, texts[i], org, height, color)
+            if len(text_pixels) > 0:
+                text_pixels = np.concatenate(text_pixels) * channels
+                for c in range(channels):
+                    flat[text_pixels + c] = text_color[c]
+        return image
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from src.number_overlay import NumberOverlay
+from src.utils import draw_text_with_box
+
+
+def _random_case(rng):
+    height, width = rng.integers(40, 700, 2)
+    channels = int(rng.choice([3, 4]))
+    image = rng.integers(0, 256, (height, width, channels), dtype=np.uint8)
+    coords = [
+        (int(rng.integers(0, height)), int(rng.integers(0, width)))
+        for _ in range(int(rng.integers(1, 200)))
+    ]
+    text_height = int(rng.choice([height // 50, 5, 12, 20, 33]))
+    color = tuple(int(c) for c in rng.integers(0, 256, 3))
+    background_color = tuple(int(c) for c in rng.integers(0, 256, 3))
+    return image, coords, text_height, color, background_color
+
+
+def _overlaps(box, boxes):
+    return any(
+        box[0] < other[2]
+        and other[0] < box[2]
+        and box[1] < other[3]
+        and other[1] < box[3]
+        for other in boxes
+    )
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_draw_matches_draw_text_with_box(seed):
+    # デフォルトの配置ではdraw_text_with_boxを順に呼んだ場合と同じ画像になる
+    rng = np.random.default_rng(seed)
+    image, coords, height, color, background_color = _random_case(rng)
+    expected = image.copy()
+    for i, coord in enumerate(coords):
+        draw_text_with_box(
+            expected,
+            str(i),
+            coord,
+            color=color,
+            background_color=background_color,
+            height=height,
+        )
+    actual = NumberOverlay().draw(
+        image.copy(),
+        coords,
+        color=color,
+        background_color=background_color,
+        height=height,
+    )
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_avoid_collision_at_top_edge():
+    # 上端で切り詰められた矩形は下にずらしても重なるので，右にずらす
+    orgs, boxes = NumberOverlay().layout(
+        [(3, 50), (3, 50)], (400, 400, 3), height=8, avoid_collision=True
+    )
+    box_w = boxes[0][3] - boxes[0][1]
+    assert orgs.tolist() == [[3, 50], [3, 50 + box_w]]
+    assert not _overlaps(boxes[1], boxes[:1])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_avoid_collision_layout(seed):
+    # ずらした番号は前の番号と重ならず，ずらした位置で描画される
+    rng = np.random.default_rng(seed)
+    image, coords, height, color, background_color = _random_case(rng)
+    overlay = NumberOverlay()
+    orgs, boxes = overlay.layout(
+        coords, image.shape, height=height, avoid_collision=True
+    )
+    moved = [i for i in range(len(coords)) if tuple(orgs[i]) != coords[i]]
+    if len(coords) > 20:
+        assert len(moved) > 0
+    for i in moved:
+        assert not _overlaps(boxes[i], boxes[:i])
+    expected = overlay.draw(
+        image.copy(),
+        orgs.tolist(),
+        color=color,
+        background_color=background_color,
+        height=height,
+    )
+    actual = overlay.draw(
+        image.copy(),
+        coords,
+        color=color,
+        background_color=background_color,
+        height=height,
+        avoid_collision=True,
+    )
+    np.testing.assert_array_equal(actual, expected)